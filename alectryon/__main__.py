@@ -19,4 +19,6 @@
 # SOFTWARE.
 
 from .cli import main
-main()
+
+if __name__ == '__main__':
+    main()
@@ -19,11 +19,11 @@
 # SOFTWARE.
 
 import argparse
-import inspect
 import os
 import os.path
-import shutil
+import re
 import sys
+from functools import lru_cache, partial
 
 # Pipelines
 # =========
@@ -59,11 +59,12 @@ def rst_to_coq(coq, fpath, point, marker):
     from .literate import rst2coq_marked
     return _catch_parsing_errors(fpath, rst2coq_marked, coq, point, marker)
 
-def annotate_chunks(chunks, fpath, cache_directory, cache_compression, sertop_args):
+def annotate_chunks(chunks, fpath, cache_directory, cache_compression, cache_format,
+                    sertop_args):
     from .core import SerAPI, annotate
     from .json import Cache
     metadata = {"sertop_args": sertop_args}
-    cache = Cache(cache_directory, fpath, metadata, cache_compression)
+    cache = Cache(cache_directory, fpath, metadata, cache_compression, cache_format)
     return cache.update(chunks, lambda c: annotate(c, sertop_args), SerAPI.version_info())
 
 def register_docutils(v, ctx):
@@ -71,24 +72,30 @@ def register_docutils(v, ctx):
     docutils.AlectryonTransform.SERTOP_ARGS = ctx["sertop_args"]
     docutils.CACHE_DIRECTORY = ctx["cache_directory"]
     docutils.CACHE_COMPRESSION = ctx["cache_compression"]
+    docutils.CACHE_FORMAT = ctx["cache_format"]
     docutils.HTML_MINIFICATION = ctx["html_minification"]
     docutils.LONG_LINE_THRESHOLD = ctx["long_line_threshold"]
     docutils.setup()
     return v
 
-def _gen_docutils(source, fpath,
-                  Parser, Reader, Writer,
-                  settings_overrides):
-    from docutils.core import publish_string
+def _publish_docutils(source, fpath,
+                      Parser, Reader, Writer,
+                      settings_overrides):
+    from docutils.core import publish_programmatically
+    from docutils.io import StringInput, StringOutput
 
-    # The encoding/decoding dance below happens because setting output_encoding
-    # to "unicode" causes reST to generate a bad <meta> tag, and setting
+    # The source is passed in as UTF-8 and the output is returned as UTF-8
+    # bytes (and written out as-is), because setting output_encoding to
+    # "unicode" causes reST to generate a bad <meta> tag, and setting
     # input_encoding to "unicode" breaks the ‘.. include’ directive.
 
     # Setting ``traceback`` unconditionally allows us to catch and report errors
     # from our own docutils components and avoid asking users to make a report
     # to the docutils mailing list.
 
+    # The publisher is returned along with the output, so that callers can
+    # inspect its settings and the messages reported while rendering.
+
     settings_overrides = {
         'traceback': True,
         'stylesheet_path': None,
@@ -98,26 +105,137 @@ def _gen_docutils(source, fpath,
     }
 
     parser = Parser()
-    return publish_string(
-        source=source.encode("utf-8"),
-        source_path=fpath, destination_path=None,
+    return publish_programmatically(
+        source_class=StringInput, source=source.encode("utf-8"),
+        source_path=fpath,
+        destination_class=StringOutput, destination=None, destination_path=None,
         reader=Reader(parser), reader_name=None,
         parser=parser, parser_name=None,
         writer=Writer(), writer_name=None,
         settings=None, settings_spec=None,
         settings_overrides=settings_overrides, config_section=None,
-        enable_exit_status=True).decode("utf-8")
+        enable_exit_status=True)
+
+def _gen_docutils(source, fpath,
+                  Parser, Reader, Writer,
+                  settings_overrides):
+    return _publish_docutils(source, fpath, Parser, Reader, Writer,
+                             settings_overrides)[0]
+
+def _docutils_config_files():
+    from docutils.frontend import OptionParser
+    if 'DOCUTILSCONFIG' in os.environ:
+        fnames = os.environ['DOCUTILSCONFIG'].split(os.pathsep)
+    else:
+        fnames = OptionParser.standard_config_files
+    return [os.path.expanduser(f) for f in fnames if f.strip()]
+
+def _file_stamp(fpath):
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _render_cache_versions():
+    """Collect the versions of the packages that rendered output depends on."""
+    import docutils
+    import pygments
+    from . import __version__
+    versions = [("alectryon", __version__), ("docutils", docutils.__version__),
+                ("pygments", pygments.__version__)]
+    for name in ("myst_parser", "markdown_it"): # Only loaded for Markdown
+        mod = sys.modules.get(name)
+        if mod is not None:
+            versions.append((name, getattr(mod, "__version__", None)))
+    return versions
+
+def _render_cache_key(source, settings_overrides):
+    """Compute a key identifying the output of docutils on `source`."""
+    from hashlib import blake2b
+    from . import GENERATOR, docutils
+    config = (docutils.AlectryonTransform.SERTOP_ARGS,
+              docutils.HTML_MINIFICATION, docutils.LONG_LINE_THRESHOLD)
+    h = blake2b(digest_size=20)
+    for part in (GENERATOR, repr(_render_cache_versions()),
+                 repr(sorted(settings_overrides.items())), repr(config), source):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _render_cache_path(cache_directory, fpath, pipeline_id):
+    """Compute the path of the cached output of `pipeline_id` on `fpath`.
+
+    There is one entry per input file and pipeline, so a new rendering of a
+    document replaces the previous one.
+    """
+    from hashlib import blake2b
+    name = repr((os.path.realpath(fpath), pipeline_id)).encode("utf-8")
+    digest = blake2b(name, digest_size=10).hexdigest()
+    fname = "{}.{}.out".format(os.path.basename(fpath), digest)
+    return os.path.join(cache_directory, "_render", fname)
+
+def _render_cache_get(entry, key):
+    """Read cached docutils output from `entry`.
+
+    Return ``None`` if there is no such output, if it was generated from a
+    different input (`key` mismatch), or if any of the files that it depends on
+    (included documents, docutils configuration files) changed.
+    """
+    from json import loads
+    try:
+        with open(entry, mode="rb") as f:
+            header = loads(f.readline())
+            if header["key"] != key:
+                return None
+            if any(_file_stamp(dep) != stamp for dep, stamp in header["deps"]):
+                return None
+            return f.read()
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def _write_atomically(fpath, chunks, binary=True):
+    """Write `chunks` (bytes, or strings if not `binary`) to `fpath`.
+
+    Chunks are written to a temporary file, which then replaces `fpath`: errors
+    (including errors raised while producing `chunks`) leave `fpath` untouched.
+    """
+    from tempfile import mkstemp
+    fd, tmp = mkstemp(dir=os.path.dirname(fpath), prefix=".tmp_")
+    try:
+        with (os.fdopen(fd, mode="wb") if binary else
+              os.fdopen(fd, mode="w", encoding="utf-8")) as f:
+            f.writelines(chunks)
+        os.chmod(tmp, 0o666 & ~_umask()) # ‘mkstemp’ creates files as 0o600
+        os.replace(tmp, fpath)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def _render_cache_put(entry, key, contents, dependencies):
+    from json import dumps
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    deps = [[dep, _file_stamp(dep)]
+            for dep in map(os.path.abspath, (*dependencies, *_docutils_config_files()))]
+    # A single file with a one-line JSON header, so that updates are atomic
+    header = dumps({"key": key, "deps": deps}).encode("utf-8")
+    _write_atomically(entry, (header, b"\n", contents))
 
 def _resolve_dialect(backend, html_dialect, latex_dialect):
     return {"webpage": html_dialect, "latex": latex_dialect}.get(backend, None)
 
 def _record_assets(assets, path, names):
-    for name in names:
-        assets.append((path, name))
+    # ‘assets’ is a dictionary used as an insertion-ordered set
+    assets.update(dict.fromkeys((path, name) for name in names))
 
 def gen_docutils(src, frontend, backend, fpath, dialect,
                  webpage_style, include_banner, include_vernums,
-                 assets):
+                 assets, cache_directory, cache_rendered_output):
     from .docutils import get_pipeline
 
     pipeline = get_pipeline(frontend, backend, dialect)
@@ -129,9 +247,27 @@ def gen_docutils(src, frontend, backend, fpath, dialect,
         'alectryon_webpage_style': webpage_style,
     }
 
-    return _gen_docutils(src, fpath,
-                         pipeline.parser, pipeline.reader, pipeline.writer,
-                         settings_overrides)
+    if not cache_rendered_output:
+        return _gen_docutils(src, fpath,
+                             pipeline.parser, pipeline.reader, pipeline.writer,
+                             settings_overrides)
+
+    entry = _render_cache_path(cache_directory, fpath, (frontend, backend, dialect))
+    key = _render_cache_key(src, settings_overrides)
+    cached = _render_cache_get(entry, key)
+    if cached is not None:
+        return cached
+
+    output, publisher = _publish_docutils(
+        src, fpath, pipeline.parser, pipeline.reader, pipeline.writer,
+        settings_overrides)
+    # Messages (including Coq errors) are only printed while rendering, so
+    # documents that reported any are not cached: they would be hidden.
+    reporter = publisher.document.reporter
+    if reporter.max_level < reporter.report_level:
+        _render_cache_put(entry, key, output,
+                          publisher.settings.record_dependencies.list)
+    return output
 
 def _docutils_cmdline(description, frontend, backend):
     import locale
@@ -171,9 +307,19 @@ def lint_docutils(source, fpath, frontend):
 
     return observer.stream.getvalue()
 
+class _FnameScrubbingTable(dict):
+    """Translation table mapping all characters but ``[-a-zA-Z0-9]`` to ``-``."""
+    ALLOWED = frozenset("-abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+
+    def __missing__(self, codepoint):
+        ch = chr(codepoint)
+        sub = self[codepoint] = ch if ch in self.ALLOWED else "-"
+        return sub
+
+_FNAME_SCRUBBING_TABLE = _FnameScrubbingTable()
+
 def _scrub_fname(fname):
-    import re
-    return re.sub("[^-a-zA-Z0-9]", "-", fname)
+    return fname.translate(_FNAME_SCRUBBING_TABLE)
 
 def apply_transforms(annotated):
     from .transforms import default_transform
@@ -212,11 +358,47 @@ def _run_coqdoc(coq_snippets, coqdoc_bin=None):
     finally:
         rmtree(dpath)
 
+COQDOC_DIV_RE = re.compile(r'<(/?)div\b([^>]*)>')
+COQDOC_CLASS_RE = re.compile(r'(?:^|\s)class="([^"]*)"')
+
+def _find_coqdoc_docs(coqdoc_output):
+    """Extract the source of each ``<div class="doc">`` block of `coqdoc_output`.
+
+    This is a linear scan over ``<div>`` tags, which is enough for coqdoc's
+    regular output (user text is escaped, so it cannot contain stray tags).
+
+    >>> for doc in _find_coqdoc_docs('''
+    ... <div class="code">Check &lt;div&gt;.</div>
+    ... <div id="a" class="doc less-space">
+    ...   <div class="paragraph"> </div>&lt;/div&gt; <div>!</div>
+    ... </div>
+    ... <div class="doc">x</div>
+    ... '''):
+    ...     print(doc)
+    <div id="a" class="doc less-space">
+      <div class="paragraph"> </div>&lt;/div&gt; <div>!</div>
+    </div>
+    <div class="doc">x</div>
+    """
+    docs, depth, start = [], 0, None
+    for m in COQDOC_DIV_RE.finditer(coqdoc_output):
+        closing, attrs = m.groups()
+        if closing:
+            if depth:
+                depth -= 1
+                if not depth:
+                    docs.append(coqdoc_output[start:m.end()])
+        elif depth:
+            depth += 1
+        else:
+            classes = COQDOC_CLASS_RE.search(attrs)
+            if classes and "doc" in classes.group(1).split():
+                depth, start = 1, m.start()
+    return docs
+
 def _gen_coqdoc_html(coqdoc_fragments):
-    from bs4 import BeautifulSoup
     coqdoc_output = _run_coqdoc(fr.contents for fr in coqdoc_fragments)
-    soup = BeautifulSoup(coqdoc_output, "html.parser")
-    docs = soup.find_all(class_='doc')
+    docs = _find_coqdoc_docs(coqdoc_output)
     coqdoc_comments = [c for c in coqdoc_fragments if not c.special]
     if len(docs) != len(coqdoc_comments):
         from pprint import pprint
@@ -253,110 +435,155 @@ def gen_html_snippets_with_coqdoc(annotated, html_classes, fname, html_minificat
     # ‘return’ instead of ‘yield from’ to update html_classes eagerly
     return _gen_html_snippets_with_coqdoc(annotated, fname, html_minification)
 
+def _copy_file(src, dst):
+    """Copy `src` to `dst`, unless `dst` appears to be an up-to-date copy."""
+    from shutil import copyfile
+    st = os.stat(src)
+    try:
+        dst_st = os.lstat(dst)
+        if dst_st.st_size == st.st_size and abs(dst_st.st_mtime - st.st_mtime) < 1:
+            return
+    except FileNotFoundError:
+        pass
+    copyfile(src, dst)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
 def copy_assets(state, assets, copy_fn, output_directory):
     if copy_fn is None:
         return state
 
+    from shutil import SameFileError
     for (path, name) in assets:
         src = os.path.join(path, name)
         dst = os.path.join(output_directory, name)
-        if copy_fn is not shutil.copy:
+        if copy_fn is not _copy_file:
             try:
                 os.unlink(dst)
             except FileNotFoundError:
                 pass
         try:
             copy_fn(src, dst)
-        except (shutil.SameFileError, FileExistsError):
+        except (SameFileError, FileExistsError):
             pass
 
     return state
 
+STANDALONE_TEMPLATE = (
+    '<!DOCTYPE html>\n<html class="alectryon-standalone">'
+    '<head><title>{title}</title>{head}</head>'
+    '<body><article class="{cls}">{body}</article></body></html>'
+)
+
+def _escape_html(s):
+    # Same escaping as dominate (``quote=True``), for identical output
+    return (s.replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace('"', "&quot;"))
+
+def _render_snippet(snippet):
+    """Render `snippet` like dominate's ``add`` would.
+
+    Other iterables than tags and strings (e.g. the lists produced for coqdoc
+    comments) are flattened:
+
+    >>> from dominate.util import raw
+    >>> _render_snippet([raw('<p class="doc">A</p>'), ("<b>",)])
+    '<p class="doc">A</p>&lt;b&gt;'
+    """
+    from dominate.dom_tag import dom_tag
+    if isinstance(snippet, str):
+        return _escape_html(snippet)
+    if isinstance(snippet, dom_tag):
+        return snippet.render(pretty=False)
+    return "".join(_render_snippet(s) for s in snippet)
+
 def dump_html_standalone(snippets, fname, webpage_style,
                          html_minification, include_banner, include_vernums,
                          assets, html_classes):
-    from dominate import tags, document
-    from dominate.util import raw
     from . import GENERATOR
     from .core import SerAPI
-    from .pygments import HTML_FORMATTER
+    from .pygments import html_stylesheet
     from .html import ASSETS, ADDITIONAL_HEADS, JS_UNMINIFY, gen_banner, wrap_classes
 
-    doc = document(title=fname)
-    doc.set_attribute("class", "alectryon-standalone")
-
-    doc.head.add(tags.meta(charset="utf-8"))
-    doc.head.add(tags.meta(name="generator", content=GENERATOR))
-
-    for hd in ADDITIONAL_HEADS:
-        doc.head.add(raw(hd))
+    # The page skeleton is fixed, so it is assembled as a string instead of
+    # building (and then serializing) a full dominate tree.
+    head = ['<meta charset="utf-8">',
+            '<meta content="{}" name="generator">'.format(_escape_html(GENERATOR))]
+    head.extend(ADDITIONAL_HEADS)
     if html_minification:
-        doc.head.add(raw(JS_UNMINIFY))
+        head.append(JS_UNMINIFY)
     for css in ASSETS.ALECTRYON_CSS:
-        doc.head.add(tags.link(rel="stylesheet", href=css))
-    for link in (ASSETS.IBM_PLEX_CDN, ASSETS.FIRA_CODE_CDN):
-        doc.head.add(raw(link))
+        head.append('<link href="{}" rel="stylesheet">'.format(_escape_html(css)))
+    head.extend((ASSETS.IBM_PLEX_CDN, ASSETS.FIRA_CODE_CDN))
     for js in ASSETS.ALECTRYON_JS:
-        doc.head.add(tags.script(src=js))
+        head.append('<script src="{}"></script>'.format(_escape_html(js)))
 
     _record_assets(assets, ASSETS.PATH, ASSETS.ALECTRYON_CSS)
     _record_assets(assets, ASSETS.PATH, ASSETS.ALECTRYON_JS)
 
-    pygments_css = HTML_FORMATTER.get_style_defs('.highlight')
-    doc.head.add(tags.style(pygments_css, type="text/css"))
+    pygments_css = html_stylesheet('.highlight')
+    head.append('<style type="text/css">{}</style>'.format(_escape_html(pygments_css)))
 
     if html_minification:
         html_classes.append("minified")
 
-    cls = wrap_classes(webpage_style, *html_classes)
-    root = doc.body.add(tags.article(cls=cls))
-    if include_banner:
-        root.add(raw(gen_banner(SerAPI.version_info(), include_vernums)))
-    for snippet in snippets:
-        root.add(snippet)
+    body = [gen_banner(SerAPI.version_info(), include_vernums)] if include_banner else []
+    body.extend(_render_snippet(s) for s in snippets)
 
-    return doc.render(pretty=False)
+    return STANDALONE_TEMPLATE.format(
+        title=_escape_html(fname), head="".join(head),
+        cls=_escape_html(wrap_classes(webpage_style, *html_classes)),
+        body="".join(body))
 
 def prepare_json(obj):
     from .json import PlainSerializer
     return PlainSerializer.encode(obj)
 
 def dump_json(js):
-    from json import dumps
-    return dumps(js, indent=4)
+    from .json import dump_bytes
+    return dump_bytes(js, indent=True)
 
 def dump_html_snippets(snippets):
-    s = ""
     for snippet in snippets:
-        s += snippet.render(pretty=True)
-        s += "<!-- alectryon-block-end -->\n"
-    return s
+        yield snippet.render(pretty=True)
+        yield "<!-- alectryon-block-end -->\n"
 
 def dump_latex_snippets(snippets):
-    s = ""
     for snippet in snippets:
-        s += str(snippet)
-        s += "\n%% alectryon-block-end\n"
-    return s
+        yield str(snippet)
+        yield "\n%% alectryon-block-end\n"
 
 def strip_extension(fname):
+    if not fname.endswith(EXTENSIONS):
+        return fname
     for ext in EXTENSIONS:
         if fname.endswith(ext):
             return fname[:-len(ext)]
     return fname
 
 def write_output(ext, contents, fname, output, output_directory):
+    # ‘contents’ is a string, UTF-8-encoded bytes, or an iterable of strings
+    binary = isinstance(contents, bytes)
+    chunks = (contents,) if isinstance(contents, (str, bytes)) else contents
     if output == "-" or (output is None and fname == "-"):
-        sys.stdout.write(contents)
+        if binary:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(contents)
+        else:
+            sys.stdout.writelines(chunks)
     else:
         if not output:
             output = os.path.join(output_directory, strip_extension(fname) + ext)
-        with open(output, mode="w", encoding="utf-8") as f:
-            f.write(contents)
+        output = os.path.realpath(output)
+        if os.path.exists(output) and not os.path.isfile(output):
+            # Devices and pipes (e.g. ``/dev/null``) cannot be replaced
+            with open(output, mode="wb" if binary else "w",
+                      encoding=None if binary else "utf-8") as f:
+                f.writelines(chunks)
+        else:
+            _write_atomically(output, chunks, binary)
 
 def write_file(ext):
-    return lambda contents, fname, output, output_directory: \
-        write_output(ext, contents, fname, output, output_directory)
+    return partial(write_output, ext)
 
 # No ‘apply_transforms’ in JSON pipelines: (we save the prover output without
 # modifications).
@@ -444,7 +671,7 @@ PIPELINES = {
 # CLI
 # ===
 
-EXTENSIONS = ['.v', '.json', '.v.rst', '.rst', '.md']
+EXTENSIONS = ('.v', '.json', '.v.rst', '.rst', '.md')
 FRONTENDS_BY_EXTENSION = [
     ('.v', 'coq+rst'), ('.json', 'json'), ('.rst', 'rst'), ('.md', 'md')
 ]
@@ -498,7 +725,7 @@ expecting one of {}"""
     return frontend, backend, supported_backends[backend]
 
 COPY_FUNCTIONS = {
-    "copy": shutil.copy,
+    "copy": _copy_file,
     "symlink": os.symlink,
     "hardlink": os.link,
     "none": None
@@ -511,6 +738,16 @@ def post_process_arguments(parser, args):
     if args.stdin_filename and "-" not in args.input:
         parser.error("argument --stdin-filename: input must be '-'")
 
+    if args.cache_rendered_output and args.cache_directory is None:
+        parser.error("argument --cache-rendered-output: requires --cache-directory")
+
+    if args.jobs < 0:
+        parser.error("argument --jobs: Expecting a non-negative number")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+
+    # Copy to avoid mutating the parser's default value
+    args.sertop_args = list(args.sertop_args)
     for dirpath in args.coq_args_I:
         args.sertop_args.extend(("-I", dirpath))
     for pair in args.coq_args_R:
@@ -534,6 +771,20 @@ def post_process_arguments(parser, args):
 
     return args
 
+FRONTEND_HELP = "Choose a frontend. Defaults: " + "; ".join(
+    "{!r} → {}".format(ext, frontend) for ext, frontend in FRONTENDS_BY_EXTENSION)
+FRONTEND_CHOICES = sorted(PIPELINES.keys())
+
+BACKEND_HELP = "Choose a backend. Supported: " + "; ".join(
+    "{} → {{{}}}".format(frontend, ", ".join(sorted(backends)))
+    for frontend, backends in PIPELINES.items())
+BACKEND_CHOICES = sorted(set(b for _, bs in PIPELINES.items() for b in bs))
+
+def _default_cache_compression():
+    from importlib.util import find_spec
+    return "zstd" if find_spec("zstandard") else "xz"
+
+@lru_cache(maxsize=None)
 def build_parser():
     parser = argparse.ArgumentParser(
         description="""\
@@ -551,21 +802,17 @@ and produce reStructuredText, HTML, LaTeX, or JSON output.""",
     in_.add_argument("--stdin-filename", default=None,
                      help=INPUT_STDIN_NAME_HELP)
 
-    FRONTEND_HELP = "Choose a frontend. Defaults: "
-    FRONTEND_HELP += "; ".join("{!r} → {}".format(ext, frontend)
-                               for ext, frontend in FRONTENDS_BY_EXTENSION)
-    FRONTEND_CHOICES = sorted(PIPELINES.keys())
     in_.add_argument("--frontend", default=None, choices=FRONTEND_CHOICES,
                      help=FRONTEND_HELP)
 
+    JOBS_HELP = ("Process up to N input files in parallel "
+                 "(default: %(default)s; 0 means one per CPU).")
+    in_.add_argument("-j", "--jobs", type=int, default=min(8, os.cpu_count() or 1),
+                     metavar="N", help=JOBS_HELP)
+
 
     out = parser.add_argument_group("Output configuration")
 
-    BACKEND_HELP = "Choose a backend. Supported: "
-    BACKEND_HELP += "; ".join(
-        "{} → {{{}}}".format(frontend, ", ".join(sorted(backends)))
-        for frontend, backends in PIPELINES.items())
-    BACKEND_CHOICES = sorted(set(b for _, bs in PIPELINES.items() for b in bs))
     out.add_argument("--backend", default=None, choices=BACKEND_CHOICES,
                      help=BACKEND_HELP)
 
@@ -604,13 +851,26 @@ and produce reStructuredText, HTML, LaTeX, or JSON output.""",
     cache_out.add_argument("--cache-directory", default=None, metavar="DIRECTORY",
                            help=CACHE_DIRECTORY_HELP)
 
-    CACHE_COMPRESSION_HELP = ("Compress caches.")
-    CACHE_COMPRESSION_CHOICES = ("none", "gzip", "xz")
+    CACHE_COMPRESSION_HELP = ("Compress caches (zstd requires the zstandard package; "
+                              "without an argument, use zstd if available and xz otherwise).")
+    CACHE_COMPRESSION_CHOICES = ("none", "gzip", "xz", "zstd")
     cache_out.add_argument("--cache-compression", nargs='?',
-                           default=None, const="xz",
+                           default=None, const=_default_cache_compression(),
                            choices=CACHE_COMPRESSION_CHOICES,
                            help=CACHE_COMPRESSION_HELP)
 
+    CACHE_RENDERED_OUTPUT_HELP = ("Also cache the final output of reST and "
+                                  "Markdown documents (requires --cache-directory).")
+    cache_out.add_argument("--cache-rendered-output", action="store_true",
+                           help=CACHE_RENDERED_OUTPUT_HELP)
+
+    CACHE_FORMAT_HELP = ("Store caches as JSON (the default) "
+                         "or as Python pickles (faster, but Python-only).")
+    CACHE_FORMAT_CHOICES = ("json", "pickle")
+    cache_out.add_argument("--cache-format", default=None,
+                           choices=CACHE_FORMAT_CHOICES,
+                           help=CACHE_FORMAT_HELP)
+
     html_out = parser.add_argument_group("HTML output configuration")
 
     WEBPAGE_STYLE_HELP = "Choose a style for standalone webpages."
@@ -695,9 +955,13 @@ def parse_arguments():
 # Entry point
 # ===========
 
+@lru_cache(maxsize=None)
+def _step_params(step):
+    import inspect
+    return tuple(inspect.signature(step).parameters.keys())[1:]
+
 def call_pipeline_step(step, state, ctx):
-    params = list(inspect.signature(step).parameters.keys())[1:]
-    return step(state, **{p: ctx[p] for p in params})
+    return step(state, **{p: ctx[p] for p in _step_params(step)})
 
 def build_context(fpath, args, frontend, backend):
     if fpath == "-":
@@ -709,7 +973,7 @@ def build_context(fpath, args, frontend, backend):
     ctx = {**vars(args),
            "fpath": fpath, "fname": fname,
            "frontend": frontend, "backend": backend, "dialect": dialect,
-           "assets": [], "html_classes": []}
+           "assets": {}, "html_classes": []}
     ctx["ctx"] = ctx
 
     if args.output_directory is None:
@@ -725,27 +989,54 @@ def except_hook(etype, value, tb):
     for line in TracebackException(etype, value, tb, capture_locals=True).format():
         print(line, file=sys.stderr)
 
-def process_pipelines(args):
+def _set_global_flags(args):
+    from . import core
+
     if args.debug:
-        from . import core
         core.DEBUG = True
 
     if args.traceback:
-        from . import core
         core.TRACEBACK = True
-        sys.excepthook = except_hook
 
     if args.expect_unexpected:
-        from . import core
         core.SerAPI.EXPECT_UNEXPECTED = True
 
+def run_pipeline(fpath, frontend, backend, pipeline, args):
+    state, ctx = None, build_context(fpath, args, frontend, backend)
+    for step in pipeline:
+        state = call_pipeline_step(step, state, ctx)
+
+def _run_pipeline_in_worker(args, fpath, frontend, backend, pipeline):
+    # Global flags are not inherited by workers with the ‘spawn’ start method
+    _set_global_flags(args)
+    run_pipeline(fpath, frontend, backend, pipeline, args)
+
+def _run_pipelines_in_parallel(args):
+    from concurrent.futures import ProcessPoolExecutor
+    # Don't spawn more workers than there are files to process
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(args.pipelines))) as ex:
+        futures = [ex.submit(_run_pipeline_in_worker, args, *p) for p in args.pipelines]
+        try:
+            for future in futures: # Report errors in input order
+                future.result()
+        finally: # Stop early on errors
+            for future in futures:
+                future.cancel()
+
+def process_pipelines(args):
+    _set_global_flags(args)
+    if args.traceback:
+        sys.excepthook = except_hook
+
     if args.output_directory:
         os.makedirs(os.path.realpath(args.output_directory), exist_ok=True)
 
-    for fpath, frontend, backend, pipeline in args.pipelines:
-        state, ctx = None, build_context(fpath, args, frontend, backend)
-        for step in pipeline:
-            state = call_pipeline_step(step, state, ctx)
+    # Files are independent, but stdin cannot be shared with worker processes
+    if args.jobs > 1 and len(args.pipelines) > 1 and "-" not in args.input:
+        _run_pipelines_in_parallel(args)
+    else:
+        for fpath, frontend, backend, pipeline in args.pipelines:
+            run_pipeline(fpath, frontend, backend, pipeline, args)
 
 def main():
     try:
@@ -20,6 +20,7 @@
 
 from collections import namedtuple, defaultdict
 from collections.abc import Iterable
+from functools import lru_cache
 from textwrap import indent
 from sys import stderr
 
@@ -114,6 +115,7 @@ class SerAPI():
     DEFAULT_PP_ARGS = {'pp_depth': 30, 'pp_margin': 55}
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def version_info(sertop_bin=SERTOP_BIN):
         bs = check_output([SerAPI.resolve_sertop(sertop_bin), "--version"])
         return GeneratorInfo("Coq+SerAPI", bs.decode('ascii', 'ignore').strip())
@@ -123,6 +123,10 @@ CACHE_COMPRESSION = None
 """Which compression to use for cache files.
 See the documentation of --cache-compression."""
 
+CACHE_FORMAT = None
+"""Which format to use for cache files.
+See the documentation of --cache-format."""
+
 HTML_MINIFICATION = False
 """Whether to minify generated HTML files."""
 
@@ -240,7 +244,8 @@ class AlectryonTransform(OneTimeTransform):
     def annotate_cached(self, chunks, sertop_args):
         from .json import Cache
         metadata = {"sertop_args": sertop_args}
-        cache = Cache(CACHE_DIRECTORY, self.document['source'], metadata, CACHE_COMPRESSION)
+        cache = Cache(CACHE_DIRECTORY, self.document['source'], metadata,
+                      CACHE_COMPRESSION, CACHE_FORMAT)
         annotated = cache.update(chunks, lambda c: annotate(c, sertop_args), SerAPI.version_info())
         return cache.generator, annotated
 
@@ -18,12 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
-import pickle
-from copy import deepcopy
-from functools import wraps
-from importlib import import_module
-from itertools import zip_longest
+from functools import lru_cache, wraps
 from os import path, makedirs, unlink
 
 from . import core
@@ -40,7 +35,7 @@ TYPE_OF_ALIASES = {
 }
 
 ALIASES_OF_TYPE = {
-    cls.__name__: alias for (alias, cls) in TYPE_OF_ALIASES.items()
+    cls: alias for (alias, cls) in TYPE_OF_ALIASES.items()
 }
 
 TYPES = list(TYPE_OF_ALIASES.values())
@@ -48,120 +43,267 @@ TYPES = list(TYPE_OF_ALIASES.values())
 class PlainSerializer:
     @staticmethod
     def encode(obj):
-        if isinstance(obj, list):
-            return [PlainSerializer.encode(x) for x in obj]
-        if isinstance(obj, dict):
-            assert "_type" not in obj
-            return {k: PlainSerializer.encode(v) for k, v in obj.items()}
-        type_name = ALIASES_OF_TYPE.get(type(obj).__name__)
+        return _encode_plain(obj)
+
+    @staticmethod
+    def decode(js):
+        return _decode_plain(js)
+
+_PLAIN_LEAVES = frozenset((str, int, bool, type(None)))
+_JSON_LEAVES = _PLAIN_LEAVES | {float}
+
+def _encode_plain(obj):
+    tp = type(obj)
+    if tp in _PLAIN_LEAVES:
+        return obj
+    encoder = _PLAIN_ENCODERS.get(tp)
+    if encoder:
+        return encoder(obj)
+    # Subclasses of the types above
+    if isinstance(obj, list):
+        return _encode_plain_list(obj)
+    if isinstance(obj, dict):
+        return _encode_plain_dict(obj)
+    assert obj is None or isinstance(obj, (int, str))
+    return obj
+
+def _encode_plain_list(obj):
+    return [_encode_plain(x) for x in obj]
+
+def _encode_plain_dict(obj):
+    assert "_type" not in obj
+    return {k: _encode_plain(v) for k, v in obj.items()}
+
+def _plain_namedtuple_encoder(type_name):
+    def _encode(obj):
+        d = {"_type": type_name} # Put _type first
+        for k, v in zip(obj._fields, obj):
+            d[k] = _encode_plain(v)
+        return d
+    return _encode
+
+_PLAIN_ENCODERS = {
+    list: _encode_plain_list, dict: _encode_plain_dict,
+    **{cls: _plain_namedtuple_encoder(alias)
+       for (cls, alias) in ALIASES_OF_TYPE.items()}
+}
+
+def _make(cls, values):
+    """Build a `cls` from a list of `values`, bypassing argument parsing."""
+    if len(values) == len(cls._fields):
+        return cls._make(values)
+    return cls(*values) # Let ``__new__`` fill in defaults or complain
+
+def _decode_plain(js):
+    if type(js) in _JSON_LEAVES:
+        return js
+    if isinstance(js, list):
+        return [_decode_plain(x) for x in js]
+    if isinstance(js, dict):
+        obj = {k: _decode_plain(v) for k, v in js.items()}
+        type_name = obj.pop("_type", None) # Avoid mutating `js`
         if type_name:
-            d = {"_type": type_name} # Put _type first
-            for k, v in zip(obj._fields, obj):
-                d[k] = PlainSerializer.encode(v)
-            return d
-        assert obj is None or isinstance(obj, (int, str))
+            return TYPE_OF_ALIASES[type_name](**obj)
+        return obj
+    return js
+
+class PickleSerializer:
+    """Leave objects untouched; for use with pickled caches."""
+    @staticmethod
+    def encode(obj):
         return obj
 
     @staticmethod
     def decode(js):
-        if isinstance(js, list):
-            return [PlainSerializer.decode(x) for x in js]
-        if isinstance(js, dict):
-            obj = {k: PlainSerializer.decode(v) for k, v in js.items()}
-            type_name = obj.pop("_type", None) # Avoid mutating `js`
-            if type_name:
-                return TYPE_OF_ALIASES[type_name](**obj)
-            return obj
         return js
 
+def _leaf_key(obj):
+    # Keep ``True`` and ``1`` apart (they compare and hash equal)
+    return ("?", obj) if isinstance(obj, bool) else obj
+
+def _fast_clone(obj):
+    """Copy `obj`, a tree of lists, dicts, and namedtuples in `TYPES`.
+    Unlike `deepcopy`, this does not preserve sharing within `obj`.
+    """
+    tp = type(obj)
+    if tp is list:
+        return [_fast_clone(x) for x in obj]
+    if tp is dict:
+        return {k: _fast_clone(v) for k, v in obj.items()}
+    if tp in ALIASES_OF_TYPE:
+        return tp._make([_fast_clone(x) for x in obj])
+    if tp in _JSON_LEAVES:
+        return obj
+    from copy import deepcopy
+    return deepcopy(obj)
+
+# Tags of the positional arrays used by deduplicating serializers
+_POINTER, _OBJECT, _LIST = 0, 1, 2
+
+def _check_list_tag(js):
+    # Untagged lists come from the format used by older versions of Alectryon
+    if not js or js[0] != _LIST:
+        MSG = "Unexpected array in deduplicated JSON (old format?): {!r}"
+        raise ValueError(MSG.format(js[:3]))
+
 class DeduplicatingSerializer:
     """Like `PlainSerializer`, but deduplicate references to objects in `TYPES`.
-    Specifically, deduplication works by replacing repeated objects with a
-    special dictionary ``{"&": N}``, where ``N`` is an index into the list of
-    all objects encoded up to that point.
+    Objects are encoded as arrays ``[1, type, *fields]``, and lists as arrays
+    ``[2, *items]``.  Deduplication works by replacing repeated objects with a
+    pointer ``[0, N]``, where ``N`` is an index into the list of all objects
+    encoded up to that point.
+
+    >>> m = core.Message("1 : nat")
+    >>> obj = [m, core.Message("1 : nat"), m, [], core.Message(True),
+    ...        core.Message(1), core.Goal(None, "True", [{"x": True, "y": [m]}])]
+    >>> js = DeduplicatingSerializer.encode(obj); js
+    [2, [1, 'message', '1 : nat'], [0, 0], [0, 0], [2],
+     [1, 'message', True], [1, 'message', 1],
+     [1, 'goal', None, 'True', [2, {'x': True, 'y': [2, [0, 0]]}]]]
+    >>> decoded = DeduplicatingSerializer.decode(js)
+    >>> decoded == obj, decoded[0] is decoded[1], decoded[5].contents is True
+    (True, True, False)
+    >>> copied = DeduplicatingSerializer.decode(js, copy=True)
+    >>> copied == obj, copied[0] is copied[1]
+    (True, False)
+    >>> DeduplicatingSerializer.decode([]) # Untagged lists use the old format
+    Traceback (most recent call last):
+    ...
+    ValueError: Unexpected array in deduplicated JSON (old format?): []
     """
     @staticmethod
     def encode(obj):
-        obj_table = {}
+        # Objects are compared structurally, using keys built from the keys of
+        # their (already-encoded) fields; a deduplicated object's key is its
+        # index in `obj_table`.  `by_id` short-circuits repeated references to
+        # the same object (`anchors` keeps these ids alive).  Dictionary keys
+        # are order-insensitive, so there is no need to sort items.
+        obj_table, by_id, anchors = {}, {}, []
         def encode(obj):
             if isinstance(obj, list):
-                return [encode(x) for x in obj]
+                pairs = [encode(x) for x in obj]
+                return [_LIST, *(v for v, _ in pairs)], ("[", tuple(k for _, k in pairs))
             if isinstance(obj, dict):
-                assert "*" not in obj and "&" not in obj
-                return {k: encode(v) for k, v in sorted(obj.items())}
-            type_name = ALIASES_OF_TYPE.get(type(obj).__name__)
+                items = [(k, encode(v)) for k, v in obj.items()]
+                return ({k: v for k, (v, _) in items},
+                        ("{", frozenset((k, key) for k, (_, key) in items)))
+            type_name = ALIASES_OF_TYPE.get(type(obj))
             if type_name:
-                key = pickle.dumps(obj)
-                if key in obj_table:
-                    return {"*": obj_table[key]}
-                d = {"&": type_name, "_": [encode(v) for v in obj]}
-                obj_table[key] = len(obj_table)
-                return d
+                ref = by_id.get(id(obj))
+                if ref is not None:
+                    return [_POINTER, ref], ("*", ref)
+                pairs = [encode(v) for v in obj]
+                key = (type_name, tuple(k for _, k in pairs))
+                ref = obj_table.get(key)
+                if ref is not None:
+                    js = [_POINTER, ref]
+                else:
+                    ref = obj_table[key] = len(obj_table)
+                    js = [_OBJECT, type_name, *(v for v, _ in pairs)]
+                by_id[id(obj)] = ref
+                anchors.append(obj)
+                return js, ("*", ref)
             assert obj is None or isinstance(obj, (int, str))
-            return obj
-        return encode(obj)
+            return obj, _leaf_key(obj)
+        return encode(obj)[0]
 
     @staticmethod
     def decode(js, copy=False):
         obj_table = []
         def decode(js):
             if isinstance(js, list):
-                return [decode(x) for x in js]
-            if isinstance(js, dict):
-                if "*" in js: # Pointer
-                    obj = obj_table[js["*"]]
-                    return deepcopy(obj) if copy else obj
-                if "&" in js: # Reference
-                    obj = TYPE_OF_ALIASES[js["&"]](*(decode(v) for v in js["_"]))
+                tag = js[0] if js else None
+                if tag == _POINTER:
+                    obj = obj_table[js[1]]
+                    return _fast_clone(obj) if copy else obj
+                if tag == _OBJECT:
+                    obj = _make(TYPE_OF_ALIASES[js[1]], [decode(v) for v in js[2:]])
                     obj_table.append(obj)
                     return obj
-                return {k: decode(v) for k, v in sorted(js.items())}
+                _check_list_tag(js)
+                return [decode(x) for x in js[1:]]
+            if isinstance(js, dict):
+                return {k: decode(v) for k, v in js.items()}
             return js
         return decode(js)
 
 class FullyDeduplicatingSerializer:
-    """Like `DeduplicatingSerializer`, but also deduplicate basic types."""
+    """Like `DeduplicatingSerializer`, but also deduplicate basic types.
+
+    >>> m = core.Message("1 : nat")
+    >>> obj = [m, core.Message("1 : nat"), m, [], core.Message(True),
+    ...        core.Message(1), core.Goal(None, "True", [{"x": True, "y": [m]}])]
+    >>> js = FullyDeduplicatingSerializer.encode(obj); js
+    [2, [1, 'message', '1 : nat'], [0, 1], [0, 1], [2],
+     [1, 'message', True], [1, 'message', 1],
+     [1, 'goal', None, 'True', [2, {'x': [0, 3], 'y': [2, [0, 1]]}]]]
+    >>> decoded = FullyDeduplicatingSerializer.decode(js)
+    >>> decoded == obj, decoded[0] is decoded[1], decoded[5].contents is True
+    (True, True, False)
+    >>> copied = FullyDeduplicatingSerializer.decode(js, copy=True)
+    >>> copied == obj, copied[0] is copied[1]
+    (True, False)
+    >>> FullyDeduplicatingSerializer.decode({"x": []}) # Old format
+    Traceback (most recent call last):
+    ...
+    ValueError: Unexpected array in deduplicated JSON (old format?): []
+    """
     @staticmethod
     def encode(obj):
-        obj_table = {}
+        # Same scheme as `DeduplicatingSerializer`, but every value is
+        # numbered, so keys are built from the indices of each value's parts.
+        obj_table, by_id, anchors = {}, {}, []
         def encode(obj):
-            key = pickle.dumps(obj)
+            ref = by_id.get(id(obj))
+            if ref is not None:
+                return [_POINTER, ref], ref
+            if type(obj) in _PLAIN_LEAVES: # Primitives are their own keys
+                val, key = obj, _leaf_key(obj)
+            else:
+                val, key = _encode(obj)
             ref = obj_table.get(key)
             if ref is not None:
-                return {"*": ref}
-            val = _encode(obj)
-            obj_table[key] = len(obj_table)
-            return val
+                val = [_POINTER, ref]
+            else:
+                ref = obj_table[key] = len(obj_table)
+            by_id[id(obj)] = ref
+            anchors.append(obj)
+            return val, ref
         def _encode(obj):
             if isinstance(obj, list):
-                return [encode(x) for x in obj]
+                pairs = [encode(x) for x in obj]
+                return [_LIST, *(v for v, _ in pairs)], ("[", tuple(r for _, r in pairs))
             if isinstance(obj, dict):
-                assert "*" not in obj and "&" not in obj
-                return {k: encode(v) for k, v in sorted(obj.items())}
-            type_name = ALIASES_OF_TYPE.get(type(obj).__name__)
+                items = [(k, encode(v)) for k, v in obj.items()]
+                return ({k: v for k, (v, _) in items},
+                        ("{", frozenset((k, r) for k, (_, r) in items)))
+            type_name = ALIASES_OF_TYPE.get(type(obj))
             if type_name:
-                return {"&": type_name, "_": [encode(v) for v in obj]}
+                pairs = [encode(v) for v in obj]
+                return ([_OBJECT, type_name, *(v for v, _ in pairs)],
+                        (type_name, tuple(r for _, r in pairs)))
             assert obj is None or isinstance(obj, (int, str))
-            return obj
-        return encode(obj)
+            return obj, _leaf_key(obj)
+        return encode(obj)[0]
 
     @staticmethod
     def decode(js, copy=False):
         obj_table = []
         def decode(js):
-            if isinstance(js, dict) and "*" in js:
-                obj = obj_table[js["*"]]
-                return deepcopy(obj) if copy else obj
+            if isinstance(js, list) and js and js[0] == _POINTER:
+                obj = obj_table[js[1]]
+                return _fast_clone(obj) if copy else obj
             obj = _decode(js)
             obj_table.append(obj)
             return obj
         def _decode(js):
             if isinstance(js, list):
-                return [decode(x) for x in js]
+                if js and js[0] == _OBJECT:
+                    return _make(TYPE_OF_ALIASES[js[1]], [decode(v) for v in js[2:]])
+                _check_list_tag(js)
+                return [decode(x) for x in js[1:]]
             if isinstance(js, dict):
-                if "&" in js:
-                    return TYPE_OF_ALIASES[js["&"]](*(decode(v) for v in js["_"]))
-                return {k: decode(v) for k, v in sorted(js.items())}
+                return {k: decode(v) for k, v in js.items()}
             return js
         return decode(js)
 
@@ -178,16 +320,31 @@ def deprecated(fn, old_name):
 json_of_annotated = deprecated(PlainSerializer.encode, "json_of_annotated")
 annotated_of_json = deprecated(PlainSerializer.decode, "annotated_of_json")
 
+def dump_bytes(js, indent=False):
+    """Serialize `js` to UTF-8 JSON bytes, using ``orjson`` if available."""
+    try:
+        import orjson
+    except ImportError:
+        import json
+        return json.dumps(js, indent=2 if indent else None, ensure_ascii=False,
+                          separators=None if indent else (",", ":")).encode("utf-8")
+    return orjson.dumps(js, option=orjson.OPT_INDENT_2 if indent else 0)
+
+def load_bytes(bs):
+    """Parse UTF-8 JSON bytes `bs`, using ``orjson`` if available."""
+    try:
+        import orjson
+    except ImportError:
+        import json
+        return json.loads(bs)
+    return orjson.loads(bs)
+
 def validate_inputs(annotated, reference):
     if isinstance(annotated, list):
-        if not isinstance(reference, list):
-            print(f"Mismatch: {annotated} {reference}")
+        if not isinstance(reference, list) or len(annotated) != len(reference):
             return False
-        return all(validate_inputs(*p) for p in zip_longest(annotated, reference))
-    # pylint: disable=isinstance-second-argument-not-valid-type
-    if isinstance(annotated, TYPES):
-        if annotated.contents != reference:
-            print(f"Mismatch: {annotated.contents} {reference}")
+        return all(validate_inputs(*p) for p in zip(annotated, reference))
+    if type(annotated) in ALIASES_OF_TYPE:
         return annotated.contents == reference
     return False
 
@@ -206,6 +363,16 @@ class BaseCache:
             self.put(chunks, annotated, generator)
         return annotated
 
+_CONTAINERS = (list, tuple, dict)
+
+# The cache root is the same for all files of a run
+_realpath = lru_cache(maxsize=None)(path.realpath)
+
+def _cache_root_realpath(cache_root):
+    # Resolve relative paths first: the working directory may change between
+    # calls in long-running hosts (Sphinx, Pelican, etc.)
+    return _realpath(path.abspath(cache_root))
+
 class FileCache(BaseCache):
     CACHE_VERSION = "1"
 
@@ -213,14 +380,27 @@ class FileCache(BaseCache):
         "none": ("builtins", ""),
         "gzip": ("gzip", ".gz"),
         "xz": ("lzma", ".xz"),
+        "zstd": ("zstandard", ".zst"),
     }
 
-    def __init__(self, cache_root, doc_path, metadata, cache_compression):
-        self.serializer = PlainSerializer
-        self.cache_root = path.realpath(cache_root)
+    KNOWN_FORMATS = {
+        "json": PlainSerializer,
+        "pickle": PickleSerializer,
+    }
+
+    # Pickles are prefixed with a header, checked before unpickling
+    PICKLE_PREFIX = b"alectryon-cache/pickle/"
+    PICKLE_HEADER = PICKLE_PREFIX + CACHE_VERSION.encode("ascii") + b"\n"
+
+    def __init__(self, cache_root, doc_path, metadata, cache_compression,
+                 cache_format=None):
+        self.cache_root = _cache_root_realpath(cache_root)
         self.wanted_compression = cache_compression or "none"
         if self.wanted_compression not in self.KNOWN_COMPRESSIONS:
             raise ValueError("Unsupported cache compression: {}".format(cache_compression))
+        self.wanted_format = cache_format or "json"
+        if self.wanted_format not in self.KNOWN_FORMATS:
+            raise ValueError("Unsupported cache format: {}".format(cache_format))
 
         doc_root = path.commonpath((self.cache_root, path.realpath(doc_path)))
         self.cache_rel_file = path.relpath(doc_path, doc_root) + ".cache"
@@ -231,17 +411,22 @@ class FileCache(BaseCache):
         self.metadata = self.normalize(metadata)
         self.metadata["cache_version"] = self.CACHE_VERSION
 
-        self.ondisk_compression, self.data = self._read()
+        self.raw_contents = None
+        self.ondisk_compression, self.ondisk_format, self.data = self._read()
+        self.serializer = self.KNOWN_FORMATS[self.ondisk_format or self.wanted_format]
 
     @staticmethod
     def normalize(obj):
         if isinstance(obj, (list, tuple)):
+            if type(obj) is list and not any(isinstance(o, _CONTAINERS) for o in obj):
+                return obj # Fast path for flat lists, like chunks
             return [FileCache.normalize(o) for o in obj]
         if isinstance(obj, dict):
             return {k: FileCache.normalize(v) for (k, v) in obj.items()}
         return obj
 
     def _open(self, compression, mode):
+        from importlib import import_module
         mod, ext = self.KNOWN_COMPRESSIONS[compression]
         return import_module(mod).open(self.cache_file + ext, mode=mode)
 
@@ -261,13 +446,41 @@ class FileCache(BaseCache):
         return True
 
     def _read(self):
-        for compression in self.KNOWN_COMPRESSIONS:
-            try:
-                with self._open(compression, mode="rt") as cache:
-                    return compression, self.normalize(json.load(cache))
-            except FileNotFoundError:
-                pass
-        return None, None
+        # Check for existence first to avoid importing unused (or missing)
+        # compression modules.
+        for compression, (_mod, ext) in self.KNOWN_COMPRESSIONS.items():
+            if path.exists(self.cache_file + ext):
+                with self._open(compression, mode="rb") as cache:
+                    contents = cache.read()
+                fmt = "pickle" if contents.startswith(self.PICKLE_PREFIX) else "json"
+                if fmt == "pickle" and self.wanted_format != "pickle":
+                    MSG = "Ignoring pickled cache {} (--cache-format is {})"
+                    print(MSG.format(self.cache_rel_file, self.wanted_format))
+                    break
+                if fmt == "pickle": # Only unpickle on request (see above)
+                    data = self._unpickle(contents)
+                else: # JSON data is already normalized (no tuples)
+                    data = load_bytes(contents)
+                if (data is not None and fmt == self.wanted_format
+                    and compression != self.wanted_compression):
+                    self.raw_contents = contents # Reused if only recompressing
+                return compression, fmt, data
+        return None, None, None
+
+    def _unpickle(self, contents):
+        import pickle
+        if not contents.startswith(self.PICKLE_HEADER):
+            MSG = "Outdated pickled cache {}: recomputing"
+            print(MSG.format(self.cache_rel_file))
+            return None
+        try:
+            return pickle.loads(memoryview(contents)[len(self.PICKLE_HEADER):])
+        # Truncated files, or classes that changed since the cache was written
+        except (pickle.UnpicklingError, EOFError, AttributeError,
+                ImportError, IndexError, TypeError, ValueError):
+            MSG = "Unreadable pickled cache {}: recomputing"
+            print(MSG.format(self.cache_rel_file))
+            return None
 
     def get(self, chunks):
         if not self._validate(chunks):
@@ -287,12 +500,23 @@ class FileCache(BaseCache):
 
     def _write(self):
         self._delete_old_caches()
-        with self._open(self.wanted_compression, mode="wt") as cache:
-            json.dump(self.data, cache, indent=2)
+        with self._open(self.wanted_compression, mode="wb") as cache:
+            if self.raw_contents is not None: # Unchanged data
+                cache.write(self.raw_contents)
+            elif self.wanted_format == "pickle":
+                import pickle
+                cache.write(self.PICKLE_HEADER)
+                pickle.dump(self.data, cache, protocol=pickle.HIGHEST_PROTOCOL)
+            else: # Compact output, unless debugging
+                cache.write(dump_bytes(self.data, indent=core.DEBUG))
         self.ondisk_compression = self.wanted_compression
+        self.ondisk_format = self.wanted_format
+        self.raw_contents = None
 
     def put(self, chunks, annotated, generator):
-        self.data = {"generator": generator,
+        self.raw_contents = None
+        self.serializer = self.KNOWN_FORMATS[self.wanted_format]
+        self.data = {"generator": self.normalize(generator),
                      "metadata": self.metadata,
                      "chunks": list(chunks),
                      "annotated": self.serializer.encode(annotated)}
@@ -300,7 +524,13 @@ class FileCache(BaseCache):
 
     def update(self, *args, **kwargs):
         annotated = super().update(*args, **kwargs)
-        if self.ondisk_compression != self.wanted_compression:
+        if self.ondisk_format != self.wanted_format:
+            MSG = "Format change requested for {} (was {}, now {}): rewriting cache file"
+            print(MSG.format(self.cache_rel_file, self.ondisk_format, self.wanted_format))
+            self.serializer = self.KNOWN_FORMATS[self.wanted_format]
+            self.data["annotated"] = self.serializer.encode(annotated)
+            self._write()
+        elif self.ondisk_compression != self.wanted_compression:
             MSG = "Recompression requested for {} (was {}, now {}): rewriting cache file"
             print(MSG.format(self.cache_rel_file, self.ondisk_compression, self.wanted_compression))
             self._write()
@@ -316,6 +546,6 @@ class DummyCache(BaseCache):
     def put(self, _chunks, _annotated, generator):
         self.generator = generator
 
-def Cache(cache_root, doc_path, metadata, cache_compression):
+def Cache(cache_root, doc_path, metadata, cache_compression, cache_format=None):
     cls = FileCache if cache_root is not None else DummyCache
-    return cls(cache_root, doc_path, metadata, cache_compression)
+    return cls(cache_root, doc_path, metadata, cache_compression, cache_format)
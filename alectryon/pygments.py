@@ -23,6 +23,7 @@ import warnings
 from collections import deque
 from textwrap import indent
 from contextlib import contextmanager
+from functools import lru_cache
 
 import pygments
 from pygments.token import Error, STANDARD_TYPES, Name, Operator
@@ -111,6 +112,11 @@ def highlight_html(coqstr):
     """
     return dom_raw("".join(_highlight(coqstr, LEXER, HTML_FORMATTER)))
 
+@lru_cache(maxsize=None)
+def html_stylesheet(selector):
+    """Return the CSS rules of ``HTML_FORMATTER``'s style, scoped to `selector`."""
+    return HTML_FORMATTER.get_style_defs(selector)
+
 PYGMENTS_LATEX_PREFIX = r"\begin{Verbatim}[commandchars=\\\{\}]" + "\n"
 PYGMENTS_LATEX_SUFFIX = r"\end{Verbatim}"
 
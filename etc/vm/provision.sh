@@ -47,7 +47,7 @@ sudo su $USERNAME <<-EOF
 	echo '***********************************'
 
 	echo '* pip install'
-    python3 -m pip install --user pygments==2.5.2 dominate==2.4.0 beautifulsoup4==4.8.2 docutils==0.16
+    python3 -m pip install --user pygments==2.5.2 dominate==2.4.0 docutils==0.16
 	python3 -m pip install --user numpy scipy matplotlib
 
 	echo ""